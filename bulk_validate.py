@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.utils import cleanup_temp_files, document_pages
+from src.bulk_worker import SUPPORTED_EXTENSIONS, rasterize_transaction
+from src.chunking import analyze_documents
+from src.prompt import analysis_prompt
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def find_transactions(root):
+    """
+    Walk a directory tree and collect every leaf folder holding supported documents.
+
+    Args:
+        root (str): Root directory of the archive, e.g. "Positive testing".
+
+    Returns:
+        list: Sorted transaction folder paths, relative to the root.
+    """
+    transactions = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirnames:
+            continue
+        if any(os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS for name in filenames):
+            transactions.append(os.path.relpath(dirpath, root))
+    return sorted(transactions)
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Load the set of transactions already completed by a previous run.
+
+    Args:
+        checkpoint_path (str): Path to the checkpoint file.
+
+    Returns:
+        set: Relative paths of completed transactions.
+    """
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def pending_transactions(transactions, checkpoint_path):
+    """
+    Filter out the transactions a previous run already completed.
+
+    Args:
+        transactions (list): Relative transaction folder paths.
+        checkpoint_path (str): Path to the checkpoint file.
+
+    Returns:
+        list: Transactions still to validate, in their original order.
+    """
+    completed = load_checkpoint(checkpoint_path)
+    return [transaction for transaction in transactions if transaction not in completed]
+
+
+def record_result(result, output_file, checkpoint_file):
+    """
+    Append a transaction result to the output and checkpoint it when it succeeded.
+
+    Only successful transactions are checkpointed, so failures are retried on the next run.
+
+    Args:
+        result (dict): Result row with "transaction" and "status" keys.
+        output_file (file): Open JSONL output file.
+        checkpoint_file (file): Open checkpoint file.
+    """
+    output_file.write(json.dumps(result) + "\n")
+    output_file.flush()
+    if result["status"] == "success":
+        checkpoint_file.write(result["transaction"] + "\n")
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+
+
+async def run(args):
+    """
+    Validate every pending transaction under the root directory and append the results to the output file.
+
+    The output may hold several rows for one transaction: failed transactions are not checkpointed and are
+    retried on every resume, and a crash between writing a result and checkpointing it repeats that result.
+    Consumers should keep only the last row per transaction.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    # Imported lazily: spawned rasterization workers re-import this script and must not initialise Vertex AI
+    from src.generate import generate_report, CHUNKING, CHUNK_MAX_PAGES, CHUNK_MAX_PIXELS
+
+    transactions = find_transactions(args.root)
+    pending = pending_transactions(transactions, args.checkpoint)
+    logger.info(f"Found {len(transactions)} transactions, {len(pending)} pending")
+
+    loop = asyncio.get_running_loop()
+    # Bound the number of transactions in flight so rasterized pages do not pile up ahead of the model calls
+    transaction_slots = asyncio.Semaphore(args.processes + args.concurrency)
+    model_slots = asyncio.Semaphore(args.concurrency)
+
+    # Use spawn so worker processes never inherit gRPC state from the parent
+    with ProcessPoolExecutor(max_workers=args.processes, mp_context=multiprocessing.get_context("spawn")) as raster_pool, \
+            open(args.output, "a") as output_file, \
+            open(args.checkpoint, "a") as checkpoint_file:
+
+        async def validate(transaction):
+            async with transaction_slots:
+                image_paths = []
+
+                # Every model call, including each page group of a large document, takes a model slot
+                async def analyze(pages, context=None):
+                    async with model_slots:
+                        return await generate_report(analysis_prompt, pages, context, args.retries)
+
+                try:
+                    documents = await loop.run_in_executor(raster_pool, rasterize_transaction, os.path.join(args.root, transaction))
+                    image_paths = document_pages(documents)
+                    if not image_paths:
+                        raise ValueError("No valid files to process.")
+                    if CHUNKING:
+                        report = await analyze_documents(documents, analyze, CHUNK_MAX_PAGES, CHUNK_MAX_PIXELS)
+                    else:
+                        report = await analyze(image_paths)
+                    result = {"transaction": transaction, "status": "success", "report": report}
+                except BrokenProcessPool:
+                    # A dead worker (e.g. out of memory) breaks the pool for every later transaction
+                    raise
+                except Exception as e:
+                    logger.error(f"Error validating transaction {transaction}: {str(e)}")
+                    result = {"transaction": transaction, "status": "error", "error": str(e)}
+                finally:
+                    cleanup_temp_files(image_paths, logger)
+
+                record_result(result, output_file, checkpoint_file)
+                logger.info(f"Finished transaction {transaction} with status {result['status']}")
+
+        tasks = [asyncio.ensure_future(validate(transaction)) for transaction in pending]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # On a fatal error stop the remaining transactions while the output files are still open
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Validate a directory tree of trade finance transactions offline and write the reports to JSONL.",
+        epilog="Resumed runs append to the output, so a transaction can appear more than once; the last row per transaction is authoritative.",
+    )
+    parser.add_argument("root", help="Root directory; every leaf folder is treated as one transaction.")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file the results are appended to.")
+    parser.add_argument("--checkpoint", help="File recording completed transactions (default: <output>.checkpoint).")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Worker processes used for PDF rasterization.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of concurrent model calls.")
+    parser.add_argument("--retries", type=int, default=2, help="Attempts per model call when the model returns invalid JSON.")
+    args = parser.parse_args()
+    if args.checkpoint is None:
+        args.checkpoint = f"{args.output}.checkpoint"
+    if args.processes < 1 or args.concurrency < 1 or args.retries < 1:
+        parser.error("--processes, --concurrency and --retries must be at least 1")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except BrokenProcessPool:
+        logger.error("A rasterization worker died unexpectedly; aborting. Rerun the same command to resume from the checkpoint.")
+        sys.exit(1)
@@ -1,18 +1,23 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from typing import List
+import asyncio
 import json
 import logging
-import re
-from src.utils import process_uploaded_files, cleanup_temp_files
-from src.generate import generate_multimodal_content
+import os
+from src.utils import process_uploaded_documents, document_pages, cleanup_temp_files, run_with_deadline, ClientDisconnected
+from src.generate import generate_report, CHUNKING, CHUNK_MAX_PAGES, CHUNK_MAX_PIXELS
+from src.chunking import analyze_documents
 from src.prompt import analysis_prompt
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Server-side deadline for a request in seconds; clients may ask for a shorter one with the X-Request-Timeout header
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Trade Finance API",
@@ -33,47 +38,95 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def request_timeout(request: Request) -> float:
+    """
+    Resolve the deadline for a request, honouring a shorter client-supplied X-Request-Timeout.
+
+    Args:
+        request (Request): The incoming request.
+
+    Returns:
+        float: Deadline in seconds.
+    """
+    try:
+        requested = float(request.headers.get("X-Request-Timeout", REQUEST_TIMEOUT))
+    except ValueError:
+        return REQUEST_TIMEOUT
+    return min(requested, REQUEST_TIMEOUT) if requested > 0 else REQUEST_TIMEOUT
+
+
 @app.post("/validate-trade-finance")
-async def validate_trade_finance(files: List[UploadFile] = File(...)):
+async def validate_trade_finance(request: Request, files: List[UploadFile] = File(...)):
     """
     Validate trade finance documents and return a JSON report.
     
+    The work is cancelled, and its temporary files removed, when the client disconnects
+    or the request deadline passes.
+    
     Args:
+        request (Request): The incoming request.
         files (list[UploadFile]): List of uploaded files.
     
     Returns:
         JSONResponse: JSON response containing the validation report.
     """
+    try:
+        report = await run_with_deadline(request, validate_files(files), request_timeout(request), logger)
+        return JSONResponse(content=report)
+    except ClientDisconnected:
+        # Nobody is listening any more; the status only shows up in access logs
+        raise HTTPException(status_code=499, detail="Client closed request.")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded.")
+
+
+async def analyze_pages(image_paths: list, context: str = None) -> dict:
+    """
+    Run the trade finance analysis on a group of page images, retrying on invalid JSON.
+    
+    Args:
+        image_paths (list): List of page image paths.
+        context (str): Optional note sent with the prompt.
+    
+    Returns:
+        dict: The parsed validation report.
+    """
+    try:
+        report = await generate_report(analysis_prompt, image_paths, context)
+        logger.info("Successfully generated content with the model.")
+        return report
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=500, detail="Invalid JSON format in API response.")
+
+
+async def validate_files(files: List[UploadFile]) -> dict:
+    """
+    Convert the uploaded files to images and run the trade finance analysis on them.
+    
+    Args:
+        files (list[UploadFile]): List of uploaded files.
+    
+    Returns:
+        dict: The parsed validation report.
+    """
     image_paths = []
-    max_retries = 2
 
     try:
         # Process uploaded files
-        image_paths = await process_uploaded_files(files, logger)
+        documents = await process_uploaded_documents(files, logger)
+        image_paths = document_pages(documents)
         if not image_paths:
             raise HTTPException(status_code=400, detail="No valid files to process.")
         
-        # Try generating content with retries
-        for attempt in range(max_retries):
-            try:
-                response_text = generate_multimodal_content(analysis_prompt, image_paths)
-                logger.info("Successfully generated content with the model.")
-                
-                # Clean and parse JSON response
-                cleaned_response = re.sub(r'^.*?{', '{', response_text, flags=re.S)
-                cleaned_response = re.sub(r'}[^}]*$', '}', cleaned_response, flags=re.S)
-                cleaned_text = json.loads(re.sub(r'\\n|/n', ' ', cleaned_response).strip("' "))
-                
-                return JSONResponse(content=cleaned_text)
-            except json.JSONDecodeError:
-                logger.error(f"JSON decoding error on attempt {attempt + 1}", exc_info=True)
-                if attempt == max_retries - 1:
-                    raise HTTPException(status_code=500, detail="Invalid JSON format in API response.")
+        # Very large documents are reviewed in page groups and reconciled with the rest of the transaction
+        if CHUNKING:
+            return await analyze_documents(documents, analyze_pages, CHUNK_MAX_PAGES, CHUNK_MAX_PIXELS)
+        return await analyze_pages(image_paths)
     except HTTPException as http_err:
         raise http_err
     except Exception as e:
         logger.error(f"Unexpected error during PDF processing: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error.")
     finally:
-        # Clean up temporary files
+        # Clean up temporary files, also when the request is cancelled
         cleanup_temp_files(image_paths, logger)
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+import os
+from src.utils import LocalFile, process_uploaded_documents
+
+# Kept apart from bulk_validate.py so spawned rasterization workers only import src.utils,
+# not src.generate and its Vertex AI initialisation
+
+logger = logging.getLogger(__name__)
+
+# File extensions picked up from a transaction folder
+SUPPORTED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
+
+
+def rasterize_transaction(folder):
+    """
+    Convert every document of a transaction folder to page images. Runs inside a worker process.
+
+    Args:
+        folder (str): Path to the transaction folder.
+
+    Returns:
+        list: List of (filename, image file paths) tuples, one per document.
+    """
+    files = [
+        LocalFile(os.path.join(folder, name))
+        for name in sorted(os.listdir(folder))
+        if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+    ]
+    return asyncio.run(process_uploaded_documents(files, logger))
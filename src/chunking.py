@@ -0,0 +1,229 @@
+import asyncio
+import json
+import math
+from PIL import Image
+
+# Values the model uses for fields it could not find in the pages it was shown
+PLACEHOLDER_VALUES = {"", "n/a", "na", "none", "null", "not available", "not provided", "not found", "not applicable"}
+
+# Values counting as "present" for the *_present fields
+PRESENT_VALUES = {"yes", "true", "present"}
+
+# Sections describing the whole transaction; only the reconciliation pass can fill them in
+TRANSACTION_SECTIONS = {"consistency_checks", "final_summary"}
+
+
+def chunk_pages(image_paths: list, max_pages: int, max_pixels: int):
+    """
+    Split the pages of one document into consecutive groups bounded by a page and pixel budget.
+
+    Pages are spread evenly over the fewest groups the page budget allows, so a 16-page document
+    with a 15-page budget becomes two groups of 8 rather than 15 and 1.
+
+    Args:
+        image_paths (list): Page image paths of the document, in page order.
+        max_pages (int): Maximum number of pages per group.
+        max_pixels (int): Maximum total pixel count per group. A single larger page gets a group of its own.
+
+    Returns:
+        list: List of page path groups; a single group when the document fits the budget.
+    """
+    if not image_paths:
+        return []
+    page_limit = math.ceil(len(image_paths) / math.ceil(len(image_paths) / max_pages))
+
+    chunks = []
+    current = []
+    current_pixels = 0
+    for image_path in image_paths:
+        with Image.open(image_path) as image:
+            width, height = image.size
+        pixels = width * height
+        if current and (len(current) >= page_limit or current_pixels + pixels > max_pixels):
+            chunks.append(current)
+            current = []
+            current_pixels = 0
+        current.append(image_path)
+        current_pixels += pixels
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def is_placeholder(value):
+    return value is None or (isinstance(value, str) and value.strip().lower() in PLACEHOLDER_VALUES)
+
+
+def is_present(value):
+    return value is True or (isinstance(value, str) and value.strip().lower() in PRESENT_VALUES)
+
+
+def partial_findings(report: dict) -> dict:
+    """
+    Keep only the facts a page group can establish on its own: extracted details and stamp/signature presence.
+
+    Verdicts (validation_status, errors, comments) and the transaction-wide sections are dropped, since a group
+    that did not see a page would otherwise report it as missing; the reconciliation pass makes the judgement.
+
+    Args:
+        report (dict): Parsed report of one page group.
+
+    Returns:
+        dict: The factual fields of each document section.
+    """
+    return {
+        name: {key: value for key, value in section.items() if key == "extracted_details" or key.endswith("_present")}
+        for name, section in report.items()
+        if isinstance(section, dict) and name not in TRANSACTION_SECTIONS
+    }
+
+
+def merge_field(key: str, values: list):
+    """
+    Merge the scalar values reported for one field by the page groups of a document, in group order.
+
+    A stamp or signature seen by any group is present; any other field takes the first value that is
+    not a placeholder.
+
+    Args:
+        key (str): Name of the field.
+        values (list): Values of the field, one per group that reported it.
+
+    Returns:
+        The merged value.
+    """
+    found = [value for value in values if not is_placeholder(value)]
+    if not found:
+        return values[0] if values else ""
+    if key.endswith("_present"):
+        return next((value for value in found if is_present(value)), found[0])
+    return found[0]
+
+
+def merge_values(values: list, key: str = None):
+    if values and all(isinstance(value, dict) for value in values):
+        keys = []
+        for value in values:
+            keys.extend(k for k in value if k not in keys)
+        return {k: merge_values([value[k] for value in values if k in value], k) for k in keys}
+
+    if values and all(isinstance(value, list) for value in values):
+        merged = []
+        for value in values:
+            merged.extend(item for item in value if not is_placeholder(item) and item not in merged)
+        return merged
+
+    return merge_field(key, values)
+
+
+def prune(value):
+    """Drop placeholder values and the sections and lists left empty by doing so."""
+    if isinstance(value, dict):
+        pruned = {key: prune(item) for key, item in value.items()}
+        pruned = {key: item for key, item in pruned.items() if item is not None}
+        return pruned or None
+    if isinstance(value, list):
+        pruned = [prune(item) for item in value]
+        pruned = [item for item in pruned if item is not None]
+        return pruned or None
+    return None if is_placeholder(value) else value
+
+
+def stitch_reports(reports: list) -> dict:
+    """
+    Stitch the partial reports of the page groups of one document into the document's findings.
+
+    Only the factual fields of each report are kept (see partial_findings). The result only depends on the
+    reports and their group order: details take the first reported value, list items are combined without
+    duplicates and a stamp or signature seen by any group is present.
+
+    Args:
+        reports (list): Parsed reports, one per page group, in page order.
+
+    Returns:
+        dict: The non-empty findings of the document.
+    """
+    return prune(merge_values([partial_findings(report) for report in reports])) or {}
+
+
+def page_group_note(filename: str, first_page: int, last_page: int, page_count: int) -> str:
+    return (
+        f"The attached images are pages {first_page}-{last_page} of the {page_count}-page document '{filename}'. "
+        "The other pages and the other documents of the transaction are reviewed separately: report only what "
+        "these pages show and leave the fields of documents that are not shown empty."
+    )
+
+
+def reconciliation_note(findings: list) -> str:
+    return (
+        "The following documents of this transaction were too large to attach and were reviewed in page groups. "
+        "Their extracted details and whether stamps and signatures were found are given below as JSON. Validate "
+        "these documents from those facts and treat them as part of the transaction together with the attached "
+        "images when filling in every section, the consistency checks and the final summary.\n"
+        + json.dumps(findings, indent=2)
+    )
+
+
+def plan_documents(documents: list, max_pages: int, max_pixels: int):
+    """
+    Work out the page groups of every document; reads each page's size, so run it off the event loop.
+
+    Args:
+        documents (list): List of (filename, page image paths) tuples.
+        max_pages (int): Maximum number of pages per model call.
+        max_pixels (int): Maximum total pixel count per model call.
+
+    Returns:
+        list: List of (filename, page image paths, page groups) tuples.
+    """
+    return [(filename, pages, chunk_pages(pages, max_pages, max_pixels)) for filename, pages in documents]
+
+
+async def analyze_documents(documents: list, analyze, max_pages: int, max_pixels: int) -> dict:
+    """
+    Analyze a transaction, reviewing the documents that exceed the budget in concurrent page groups.
+
+    Each oversized document is split along its own pages only. Its page groups are analyzed concurrently
+    and stitched into the document's factual findings. A final reconciliation pass then analyzes the
+    remaining documents together with those findings, so validation verdicts, consistency checks and the
+    final summary are always judged on the whole transaction. Remaining calls are cancelled if one fails.
+
+    Args:
+        documents (list): List of (filename, page image paths) tuples, in upload order.
+        analyze (callable): Coroutine function taking page image paths and an optional context note and
+            returning a parsed report.
+        max_pages (int): Maximum number of pages per model call.
+        max_pixels (int): Maximum total pixel count per model call.
+
+    Returns:
+        dict: The validation report.
+    """
+    plans = await asyncio.to_thread(plan_documents, documents, max_pages, max_pixels)
+    large = [(filename, pages, groups) for filename, pages, groups in plans if len(groups) > 1]
+    if not large:
+        return await analyze([page for _, pages in documents for page in pages])
+
+    jobs = []
+    for index, (filename, pages, groups) in enumerate(large):
+        first_page = 1
+        for group in groups:
+            last_page = first_page + len(group) - 1
+            jobs.append((index, group, page_group_note(filename, first_page, last_page, len(pages))))
+            first_page = last_page + 1
+
+    tasks = [asyncio.ensure_future(analyze(group, note)) for _, group, note in jobs]
+    try:
+        partials = await asyncio.gather(*tasks)
+    finally:
+        # Wait for cancelled calls to stop so callers can safely remove the page images
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    findings = []
+    for index, (filename, _, _) in enumerate(large):
+        reports = [report for (job_index, _, _), report in zip(jobs, partials) if job_index == index]
+        findings.append({"document": filename, "findings": stitch_reports(reports)})
+
+    remaining = [page for _, pages, groups in plans if len(groups) == 1 for page in pages]
+    return await analyze(remaining, reconciliation_note(findings))
@@ -1,9 +1,13 @@
 import vertexai
 from vertexai.generative_models import GenerativeModel, Image, Part, SafetySetting
+import asyncio
+import json
 import os
 import logging
 import yaml
 from src.prompt import system_prompt, static_prompt
+from src.prompt_cache import PromptCache, VertexCacheBackend
+from src.utils import parse_model_response
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file
@@ -22,6 +26,11 @@ PROJECT_NAME = config["PROJECT_NAME"]
 LOCATION = config["LOCATION"]
 MODEL = config["MODEL"]
 
+# Documents exceeding either budget per model call are reviewed in page groups, then reconciled with the rest
+CHUNKING = config.get("CHUNKING", False)
+CHUNK_MAX_PAGES = config.get("CHUNK_MAX_PAGES", 15)
+CHUNK_MAX_PIXELS = config.get("CHUNK_MAX_PIXELS", 130000000)
+
 # Define safety settings to filter out harmful or unwanted content in the model's output
 safety_settings = [
     SafetySetting(
@@ -55,29 +64,64 @@ vertexai.init(project=PROJECT_NAME, location=LOCATION)
 # Load the Generative Model using the specified model and system prompt
 model = GenerativeModel(MODEL, system_instruction=[system_prompt])
 
+# Cache the fixed system and analysis prompts server-side so they are not resent with every request
+prompt_cache = PromptCache(
+    VertexCacheBackend(MODEL),
+    system_prompt,
+    ttl=config.get("PROMPT_CACHE_TTL", 3600),
+) if config.get("PROMPT_CACHE", False) else None
+
+
+def load_images(image_paths: list):
+    """
+    Load the images to be sent alongside the prompt.
+
+    Args:
+        image_paths (list): List of file paths to images.
+
+    Returns:
+        list: Loaded images.
+    """
+    return [Image.load_from_file(image_path) for image_path in image_paths]
+
+
+def select_model(prompt: str):
+    """
+    Pick the model to call and the prompt parts to send inline.
+
+    Args:
+        prompt (str): The text input prompt to guide content generation.
+
+    Returns:
+        tuple: The model, and the prompt parts to prepend to the images (empty when the prompt is cached).
+    """
+    prefix = f"{static_prompt} : {prompt}"
+    cached_model = prompt_cache.get_model(prefix) if prompt_cache else None
+    if cached_model is not None:
+        return cached_model, []
+    return model, [prefix]
+
+
 # Function to generate multimodal content (text from images + prompt)
-def generate_multimodal_content(prompt: str, image_paths: list):
+def generate_multimodal_content(prompt: str, image_paths: list, context: str = None):
     """
     Generate multimodal content based on the provided text prompt and images.
 
     Args:
         prompt (str): The text input prompt to guide content generation.
         image_paths (list): List of file paths to images to be used in content generation.
+        context (str): Optional note sent after the prompt, e.g. findings from earlier calls.
 
     Returns:
         str: The generated text content.
     """
     try:
-        images = []
-        
-        # Load each image from the provided file paths
-        for image_path in image_paths:
-            image = Image.load_from_file(image_path)
-            images.append(image)
+        images = load_images(image_paths)
+        active_model, prompt_parts = select_model(prompt)
 
         # Generate content using the prompt, static prompt, and images
-        response = model.generate_content(
-            [f"{static_prompt} : {prompt}"] + images,
+        response = active_model.generate_content(
+            prompt_parts + ([context] if context else []) + images,
             generation_config=generation_config,
             safety_settings=safety_settings
         )
@@ -88,3 +132,59 @@ def generate_multimodal_content(prompt: str, image_paths: list):
         # Log any errors encountered during the generation proces
         logging.error(f"Error generating content with AI: {str(e)}")
         raise
+
+
+async def generate_multimodal_content_async(prompt: str, image_paths: list, context: str = None):
+    """
+    Async variant of generate_multimodal_content. Cancelling the awaiting task aborts the in-flight model call.
+
+    Args:
+        prompt (str): The text input prompt to guide content generation.
+        image_paths (list): List of file paths to images to be used in content generation.
+        context (str): Optional note sent after the prompt, e.g. findings from earlier calls.
+
+    Returns:
+        str: The generated text content.
+    """
+    try:
+        # Reading the page images and creating a cached context are blocking, keep them off the event loop
+        images = await asyncio.to_thread(load_images, image_paths)
+        active_model, prompt_parts = await asyncio.to_thread(select_model, prompt)
+
+        response = await active_model.generate_content_async(
+            prompt_parts + ([context] if context else []) + images,
+            generation_config=generation_config,
+            safety_settings=safety_settings
+        )
+
+        return response.text
+
+    except Exception as e:
+        logging.error(f"Error generating content with AI: {str(e)}")
+        raise
+
+
+async def generate_report(prompt: str, image_paths: list, context: str = None, max_retries: int = 2):
+    """
+    Generate content for the images and parse it as a JSON report, retrying when the model returns invalid JSON.
+
+    Args:
+        prompt (str): The text input prompt to guide content generation.
+        image_paths (list): List of file paths to images to be used in content generation.
+        context (str): Optional note sent after the prompt.
+        max_retries (int): Number of attempts.
+
+    Returns:
+        dict: The parsed report.
+
+    Raises:
+        json.JSONDecodeError: If the last attempt still returned invalid JSON.
+    """
+    for attempt in range(max_retries):
+        response_text = await generate_multimodal_content_async(prompt, image_paths, context)
+        try:
+            return parse_model_response(response_text)
+        except json.JSONDecodeError:
+            logging.error(f"JSON decoding error on attempt {attempt + 1}", exc_info=True)
+            if attempt == max_retries - 1:
+                raise
@@ -0,0 +1,154 @@
+import datetime
+import hashlib
+import logging
+import threading
+import time
+
+# Context caching and GenerativeModel.from_cached_content only exist in the preview namespace of
+# newer Vertex AI SDKs; without them prompts are sent inline
+try:
+    from vertexai.preview import caching
+    from vertexai.preview.generative_models import GenerativeModel
+except ImportError:
+    caching = None
+    GenerativeModel = None
+
+
+class VertexCacheBackend:
+    """
+    Cache backend using the Vertex AI context caching API.
+
+    Args:
+        model_name (str): Name of the model the cached content is created for.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.supported = caching is not None and hasattr(GenerativeModel, "from_cached_content")
+
+    def create(self, system_instruction: str, contents: list, ttl: int, display_name: str):
+        """Create a cached content handle holding the system instruction and prompt prefix."""
+        return caching.CachedContent.create(
+            model_name=self.model_name,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl),
+            display_name=display_name,
+        )
+
+    def model_for(self, handle):
+        """Return a model that generates on top of the cached content."""
+        return GenerativeModel.from_cached_content(cached_content=handle)
+
+
+class LocalCacheBackend:
+    """
+    In-memory cache backend for tests and local runs, recording every handle it creates.
+
+    Args:
+        model_factory (callable): Optional callable building the model returned for a handle.
+        supported (bool): Set to False to exercise the inline prompt fallback.
+    """
+
+    def __init__(self, model_factory=None, supported: bool = True):
+        self.model_name = "local"
+        self.supported = supported
+        self.model_factory = model_factory
+        self.created = []
+
+    def create(self, system_instruction: str, contents: list, ttl: int, display_name: str):
+        handle = {
+            "name": f"cachedContents/local-{len(self.created)}",
+            "display_name": display_name,
+            "system_instruction": system_instruction,
+            "contents": contents,
+            "ttl": ttl,
+        }
+        self.created.append(handle)
+        return handle
+
+    def model_for(self, handle):
+        return self.model_factory(handle) if self.model_factory else handle
+
+
+class PromptCache:
+    """
+    Keeps a cached content handle per fixed prompt prefix, versioned by prompt hash and refreshed before expiry.
+
+    Args:
+        backend: Cache backend creating the handles (VertexCacheBackend or LocalCacheBackend).
+        system_instruction (str): System prompt stored with every cached prefix.
+        ttl (int): Lifetime of a cached content handle in seconds.
+        refresh_margin (int): Seconds before expiry at which a handle is replaced.
+        retry_backoff (int): Seconds to wait after a failed create before trying again; keep it well below
+            refresh_margin so a failed refresh is retried before the current handle expires.
+        clock (callable): Monotonic clock, replaceable in tests.
+    """
+
+    def __init__(self, backend, system_instruction: str, ttl: int = 3600, refresh_margin: int = 300, retry_backoff: int = 60, clock=time.monotonic):
+        self.backend = backend
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_backoff = retry_backoff
+        self.clock = clock
+        self._entries = {}
+        self._retry_at = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def prompt_hash(self, prefix: str) -> str:
+        """Hash identifying a version of the model, system instruction and prompt prefix."""
+        digest = hashlib.sha256()
+        for part in (self.backend.model_name, self.system_instruction, prefix):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_model(self, prefix: str):
+        """
+        Return a model generating on top of the cached prefix, creating or refreshing the cache when needed.
+
+        Args:
+            prefix (str): The fixed prompt prefix.
+
+        Returns:
+            The cached model, or None when the prompt has to be sent inline.
+        """
+        if not self.backend.supported:
+            return None
+
+        key = self.prompt_hash(prefix)
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            current = entry["model"] if entry and now < entry["expires_at"] else None
+            if entry and now < entry["expires_at"] - self.refresh_margin:
+                return entry["model"]
+            # Only one caller creates the handle; the others keep using the current one meanwhile
+            if key in self._refreshing or now < self._retry_at.get(key, 0):
+                return current
+            self._refreshing.add(key)
+
+        try:
+            handle = self.backend.create(
+                self.system_instruction,
+                [prefix],
+                self.ttl,
+                display_name=f"trade-finance-{key[:12]}",
+            )
+            model = self.backend.model_for(handle)
+        except Exception as e:
+            # Fall back to the current handle or inline prompts, and retry after a short backoff
+            logging.warning(f"Prompt caching unavailable, sending prompts inline: {str(e)}")
+            with self._lock:
+                self._retry_at[key] = now + self.retry_backoff
+                self._refreshing.discard(key)
+            return current
+
+        with self._lock:
+            # Superseded handles are left to expire so in-flight requests using them are unaffected
+            self._entries[key] = {"handle": handle, "model": model, "expires_at": now + self.ttl}
+            self._refreshing.discard(key)
+        logging.info(f"Created cached prompt context {key[:12]}")
+        return model
@@ -1,15 +1,42 @@
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import aiofiles
+import asyncio
+import json
+import mimetypes
 import os 
+import re
 import tempfile
 import platform
+import uuid
 
 
 # Environment variable for Poppler path, needed for PDF to image conversion (on Windows)
 POPLER_PATH = os.getenv("POPLER_PATH", r"poppler-24.07.0\Library\bin")
+
+# Pages rendered per Poppler call; bounds the work left running after a cancellation while
+# avoiding a new pdftoppm process and PDF parse for every single page
+PDF_PAGE_BATCH_SIZE = int(os.getenv("PDF_PAGE_BATCH_SIZE", "4"))
  
 
 
+class LocalFile:
+    """
+    Minimal stand-in for an UploadFile backed by a file on disk, so offline tools can reuse the upload pipeline.
+    
+    Args:
+        path (str): Path to the file on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.content_type = mimetypes.guess_type(path)[0]
+
+    async def read(self):
+        async with aiofiles.open(self.path, 'rb') as f:
+            return await f.read()
+
+
 async def process_uploaded_files(files, logger):
     """
     Process a list of uploaded files and convert them to image file paths.
@@ -21,29 +48,66 @@ async def process_uploaded_files(files, logger):
     Returns:
         list: List of image file paths generated from the uploaded files.
     """
-    image_paths = []
+    documents = await process_uploaded_documents(files, logger)
+    return document_pages(documents)
+
+
+async def process_uploaded_documents(files, logger):
+    """
+    Process a list of uploaded files and convert them to page images, keeping the pages of each file together.
+    
+    Args:
+        files (list[UploadFile]): List of uploaded files.
+        logger (logging.Logger): Logger instance for logging operations.
+    
+    Returns:
+        list: List of (filename, image file paths) tuples, one per processed file.
+    """
+    documents = []
     try:
         for file in files:
             logger.info(f"Received file: {file.filename} of type {file.content_type}")
             
             if file.content_type == "application/pdf":
                 pdf_paths = await process_pdf(file, logger)
-                image_paths.extend(pdf_paths)
+                if pdf_paths:
+                    documents.append((file.filename, pdf_paths))
             elif file.content_type in ["image/jpeg", "image/png"]:
                 image_path = await process_image(file, logger)
-                image_paths.append(image_path)
+                documents.append((file.filename, [image_path]))
             else:
                 logger.error(f"Unsupported file type: {file.filename}")
-        return image_paths
+        return documents
+    except asyncio.CancelledError:
+        logger.info("Cancelled processing of uploaded files")
+        cleanup_temp_files(document_pages(documents), logger)
+        raise
     except Exception as e:
         logger.error(f"Error processing files: {str(e)}")
+        cleanup_temp_files(document_pages(documents), logger)
         raise
 
 
+def document_pages(documents):
+    """
+    Flatten processed documents into their page image paths, in upload order.
+    
+    Args:
+        documents (list): List of (filename, image file paths) tuples.
+    
+    Returns:
+        list: List of image file paths.
+    """
+    return [image_path for _, image_paths in documents for image_path in image_paths]
+
+
 async def process_pdf(file, logger):
     """
     Process a PDF file and convert each page to an image.
     
+    Pages are rendered in small batches in a worker thread, so cancelling the calling task
+    stops any remaining batches from being queued and removes the pages already written.
+    
     Args:
         file (UploadFile): The uploaded PDF file.
         logger (logging.Logger): Logger instance for logging operations.
@@ -58,21 +122,39 @@ async def process_pdf(file, logger):
             await temp_pdf_file.write(await file.read())
             pdf_path = temp_pdf_file.name
         
-        images = convert_from_path(pdf_path, dpi=300, poppler_path=POPLER_PATH) if platform.system() == "Windows" else convert_from_path(pdf_path, dpi=300)
+        info = await asyncio.to_thread(pdfinfo_from_path, pdf_path, **poppler_options())
+        page_count = int(info.get("Pages", 0))
         
-        if not images:
+        if not page_count:
             logger.error(f"No images extracted from PDF: {file.filename}")
             return []
         
-        for page_num, image in enumerate(images):
-            image_path = os.path.join(tempfile.gettempdir(), f"{file.filename}_page_{page_num + 1}.png")
-            image.save(image_path, 'PNG')
-            pdf_paths.append(image_path)
-            logger.info(f"Processed page {page_num + 1} of PDF: {file.filename}")
+        # Prefix with a unique token so concurrent requests carrying the same filename do not overwrite each other's pages
+        token = uuid.uuid4().hex
+        for first_page in range(1, page_count + 1, PDF_PAGE_BATCH_SIZE):
+            last_page = min(first_page + PDF_PAGE_BATCH_SIZE - 1, page_count)
+            batch_paths = [
+                os.path.join(tempfile.gettempdir(), f"{token}_{os.path.basename(file.filename)}_page_{page_num}.png")
+                for page_num in range(first_page, last_page + 1)
+            ]
+            pdf_paths.extend(batch_paths)
+            render = asyncio.ensure_future(asyncio.to_thread(render_pdf_pages, pdf_path, first_page, batch_paths))
+            try:
+                await asyncio.shield(render)
+            except asyncio.CancelledError:
+                # A running poppler call cannot be interrupted; wait for it so its output and the PDF can be removed
+                await asyncio.gather(render, return_exceptions=True)
+                raise
+            logger.info(f"Processed pages {first_page}-{last_page} of PDF: {file.filename}")
         
         return pdf_paths
+    except asyncio.CancelledError:
+        logger.info(f"Cancelled processing of PDF {file.filename}")
+        cleanup_temp_files(pdf_paths, logger)
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF {file.filename}: {str(e)}")
+        cleanup_temp_files(pdf_paths, logger)
         raise
     finally:
         if pdf_path and os.path.exists(pdf_path):
@@ -83,6 +165,35 @@ async def process_pdf(file, logger):
                 logger.error(f"Error deleting temporary PDF file {pdf_path}: {str(e)}")
 
 
+def poppler_options():
+    """
+    Build the keyword arguments pointing pdf2image at the Poppler binaries.
+    
+    Returns:
+        dict: Keyword arguments for pdf2image calls.
+    """
+    return {"poppler_path": POPLER_PATH} if platform.system() == "Windows" else {}
+
+
+def render_pdf_pages(pdf_path, first_page, image_paths):
+    """
+    Render consecutive PDF pages with a single Poppler call and save them as PNG images.
+    
+    Args:
+        pdf_path (str): Path to the PDF file.
+        first_page (int): 1-based number of the first page to render.
+        image_paths (list): Destination paths, one per page starting at first_page.
+    
+    Returns:
+        list: Paths to the saved images.
+    """
+    last_page = first_page + len(image_paths) - 1
+    images = convert_from_path(pdf_path, dpi=300, first_page=first_page, last_page=last_page, **poppler_options())
+    for image, image_path in zip(images, image_paths):
+        image.save(image_path, 'PNG')
+    return image_paths
+
+
 async def process_image(file, logger):
     """
     Process an image file and save it temporarily.
@@ -121,3 +232,67 @@ def cleanup_temp_files(image_paths, logger):
                 logger.info(f"Deleted temporary file: {path}")
         except Exception as e:
             logger.error(f"Error deleting temporary file {path}: {str(e)}")
+
+
+def parse_model_response(response_text):
+    """
+    Extract and parse the JSON report from the raw model response text.
+    
+    Args:
+        response_text (str): Raw text returned by the model.
+    
+    Returns:
+        dict: Parsed JSON report.
+    
+    Raises:
+        json.JSONDecodeError: If the response does not contain valid JSON.
+    """
+    cleaned_response = re.sub(r'^.*?{', '{', response_text, flags=re.S)
+    cleaned_response = re.sub(r'}[^}]*$', '}', cleaned_response, flags=re.S)
+    return json.loads(re.sub(r'\\n|/n', ' ', cleaned_response).strip("' "))
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before its request has been handled."""
+
+
+async def run_with_deadline(request, coro, timeout, logger, poll_interval=0.5):
+    """
+    Run a coroutine for a request, cancelling it when the client disconnects or the deadline passes.
+    
+    Cancellation is awaited before returning so the coroutine's own cleanup has run.
+    
+    Args:
+        request (Request): The incoming request, polled for client disconnects.
+        coro (Coroutine): The request handling work.
+        timeout (float): Deadline in seconds.
+        logger (logging.Logger): Logger instance for logging operations.
+        poll_interval (float): Seconds between disconnect checks.
+    
+    Returns:
+        Any: The result of the coroutine.
+    
+    Raises:
+        ClientDisconnected: If the client disconnected first.
+        asyncio.TimeoutError: If the deadline passed first.
+    """
+    async def wait_for_disconnect():
+        while not await request.is_disconnected():
+            await asyncio.sleep(poll_interval)
+
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait({task, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            return task.result()
+        if watcher in done:
+            logger.warning("Client disconnected, cancelling request")
+            raise ClientDisconnected()
+        logger.warning(f"Request exceeded its {timeout}s deadline, cancelling")
+        raise asyncio.TimeoutError()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,56 @@
+import json
+from bulk_validate import find_transactions, load_checkpoint, pending_transactions, record_result
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"%PDF-1.4")
+
+
+def test_find_transactions_returns_leaf_folders_with_documents(tmp_path):
+    touch(tmp_path / "Positive testing" / "Transaction 1" / "Invoice01.PDF")
+    touch(tmp_path / "Positive testing" / "Transaction 2" / "A2_form.pdf")
+    touch(tmp_path / "Negative testing" / "Transaction 1" / "scan.JPG")
+    touch(tmp_path / "Negative testing" / "Transaction 2" / "notes.txt")
+    touch(tmp_path / "Positive testing" / "cover.pdf")
+
+    assert find_transactions(str(tmp_path)) == [
+        "Negative testing/Transaction 1",
+        "Positive testing/Transaction 1",
+        "Positive testing/Transaction 2",
+    ]
+
+
+def test_load_checkpoint_missing_file(tmp_path):
+    assert load_checkpoint(str(tmp_path / "results.jsonl.checkpoint")) == set()
+
+
+def test_pending_transactions_skips_checkpointed(tmp_path):
+    checkpoint = tmp_path / "results.jsonl.checkpoint"
+    checkpoint.write_text("Transaction 1\n\nTransaction 3\n")
+
+    transactions = ["Transaction 1", "Transaction 2", "Transaction 3", "Transaction 4"]
+    assert pending_transactions(transactions, str(checkpoint)) == ["Transaction 2", "Transaction 4"]
+
+
+def test_failed_transactions_are_rerun_on_resume(tmp_path):
+    output = tmp_path / "results.jsonl"
+    checkpoint = tmp_path / "results.jsonl.checkpoint"
+    transactions = ["Transaction 1", "Transaction 2"]
+
+    with open(output, "a") as output_file, open(checkpoint, "a") as checkpoint_file:
+        record_result({"transaction": "Transaction 1", "status": "success", "report": {}}, output_file, checkpoint_file)
+        record_result({"transaction": "Transaction 2", "status": "error", "error": "boom"}, output_file, checkpoint_file)
+
+    assert pending_transactions(transactions, str(checkpoint)) == ["Transaction 2"]
+
+    with open(output, "a") as output_file, open(checkpoint, "a") as checkpoint_file:
+        record_result({"transaction": "Transaction 2", "status": "success", "report": {}}, output_file, checkpoint_file)
+
+    assert pending_transactions(transactions, str(checkpoint)) == []
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(row["transaction"], row["status"]) for row in rows] == [
+        ("Transaction 1", "success"),
+        ("Transaction 2", "error"),
+        ("Transaction 2", "success"),
+    ]
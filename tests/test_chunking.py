@@ -0,0 +1,184 @@
+import asyncio
+import json
+import pytest
+from PIL import Image
+from src.chunking import analyze_documents, chunk_pages, stitch_reports
+
+
+@pytest.fixture
+def make_pages(tmp_path):
+    def make(count, size=(100, 100), prefix="page"):
+        paths = []
+        for index in range(count):
+            path = tmp_path / f"{prefix}_{index + 1}.png"
+            Image.new("L", size).save(path)
+            paths.append(str(path))
+        return paths
+    return make
+
+
+def section(**fields):
+    report = {
+        "validation_status": "",
+        "errors": [""],
+        "comments": "",
+        "stamp_present": "",
+        "signature_present": "",
+    }
+    report.update(fields)
+    return report
+
+
+def test_chunk_pages_keeps_document_within_budget_whole(make_pages):
+    pages = make_pages(15)
+    assert chunk_pages(pages, 15, 10 ** 9) == [pages]
+
+
+def test_chunk_pages_balances_groups_by_page_budget(make_pages):
+    pages = make_pages(16)
+    chunks = chunk_pages(pages, 15, 10 ** 9)
+    assert [len(chunk) for chunk in chunks] == [8, 8]
+    assert sum(chunks, []) == pages
+
+
+def test_chunk_pages_respects_pixel_budget(make_pages):
+    pages = make_pages(5)
+    chunks = chunk_pages(pages, 15, 25000)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_chunk_pages_gives_oversized_page_its_own_group(make_pages):
+    pages = make_pages(1, size=(300, 300), prefix="big") + make_pages(1)
+    assert chunk_pages(pages, 15, 25000) == [[pages[0]], [pages[1]]]
+
+
+def test_chunk_pages_empty_document():
+    assert chunk_pages([], 15, 10 ** 9) == []
+
+
+def test_stitch_present_fields_are_ored():
+    reports = [
+        {"invoice": section(stamp_present=False, signature_present="No")},
+        {"invoice": section(stamp_present=True, signature_present="Yes")},
+        {"invoice": section(stamp_present=False, signature_present="No")},
+    ]
+    invoice = stitch_reports(reports)["invoice"]
+    assert invoice["stamp_present"] is True
+    assert invoice["signature_present"] == "Yes"
+
+
+def test_stitch_present_fields_absent_everywhere():
+    reports = [{"invoice": section(stamp_present=False)}, {"invoice": section(stamp_present="")}]
+    assert stitch_reports(reports)["invoice"]["stamp_present"] is False
+
+
+def test_stitch_details_take_first_reported_value_and_lists_are_deduplicated():
+    reports = [
+        {"bill_of_lading": {"extracted_details": {"vessel_name": "N/A", "port_of_loading": "Chennai",
+                                                  "container_no": ["MSKU1234567", ""]}}},
+        {"bill_of_lading": {"extracted_details": {"vessel_name": "MSC Anna", "port_of_loading": "Mumbai",
+                                                  "container_no": ["MSKU1234567", "TGHU7654321"]}}},
+    ]
+    details = stitch_reports(reports)["bill_of_lading"]["extracted_details"]
+    assert details == {
+        "vessel_name": "MSC Anna",
+        "port_of_loading": "Chennai",
+        "container_no": ["MSKU1234567", "TGHU7654321"],
+    }
+
+
+def test_stitch_drops_verdicts_of_groups_that_missed_a_page():
+    reports = [
+        {"bill_of_lading": section(extracted_details={"bl_number": "BL-42"}, validation_status="fail",
+                                   errors=["Missing signature"], comments="No signature on these pages.",
+                                   signature_present=False)},
+        {"bill_of_lading": section(extracted_details={"bl_number": ""}, validation_status="pass",
+                                   signature_present=True)},
+    ]
+    assert stitch_reports(reports) == {
+        "bill_of_lading": {"extracted_details": {"bl_number": "BL-42"}, "signature_present": True},
+    }
+
+
+def test_stitch_drops_transaction_sections():
+    reports = [
+        {"invoice": section(extracted_details={"invoice_number": "INV-1"}),
+         "consistency_checks": {"parties": "inconsistent - B/L missing"},
+         "final_summary": {"overall_risk_rating": "Red"}},
+    ]
+    assert stitch_reports(reports) == {"invoice": {"extracted_details": {"invoice_number": "INV-1"}}}
+
+
+def test_stitch_is_deterministic():
+    reports = [
+        {"invoice": section(extracted_details={"amount": "100"}, stamp_present="No")},
+        {"invoice": section(extracted_details={"amount": "200"}, stamp_present="Yes")},
+    ]
+    assert stitch_reports(reports) == stitch_reports(json.loads(json.dumps(reports)))
+    assert stitch_reports(reports) == {"invoice": {"extracted_details": {"amount": "100"}, "stamp_present": "Yes"}}
+
+
+def test_analyze_documents_single_call_when_all_documents_fit(make_pages):
+    documents = [("Invoice.pdf", make_pages(2, prefix="invoice")), ("A2_form.pdf", make_pages(3, prefix="a2"))]
+    calls = []
+
+    async def analyze(pages, context=None):
+        calls.append((pages, context))
+        return {"final_summary": {"overall_risk_rating": "Green"}}
+
+    report = asyncio.run(analyze_documents(documents, analyze, 15, 10 ** 9))
+    assert report == {"final_summary": {"overall_risk_rating": "Green"}}
+    assert calls == [(documents[0][1] + documents[1][1], None)]
+
+
+def test_analyze_documents_splits_only_large_documents_and_reconciles(make_pages):
+    bill = make_pages(4, prefix="bill")
+    invoice = make_pages(1, prefix="invoice")
+    documents = [("Bill of lading.pdf", bill), ("Invoice.pdf", invoice)]
+    calls = []
+
+    async def analyze(pages, context=None):
+        calls.append((pages, context))
+        if pages == bill[:2]:
+            return {"bill_of_lading": section(extracted_details={"bl_number": "BL-42"}, validation_status="fail",
+                                              stamp_present=False),
+                    "final_summary": {"overall_risk_rating": "Red"}}
+        if pages == bill[2:]:
+            return {"bill_of_lading": section(validation_status="pass", stamp_present=True)}
+        return {"final_summary": {"overall_risk_rating": "Green"}}
+
+    report = asyncio.run(analyze_documents(documents, analyze, 2, 10 ** 9))
+
+    assert report == {"final_summary": {"overall_risk_rating": "Green"}}
+    assert [pages for pages, _ in calls[:2]] == [bill[:2], bill[2:]]
+    assert "pages 1-2 of the 4-page document 'Bill of lading.pdf'" in calls[0][1]
+    assert "pages 3-4 of the 4-page document 'Bill of lading.pdf'" in calls[1][1]
+
+    pages, note = calls[2]
+    assert pages == invoice
+    findings = json.loads(note[note.index("["):])
+    assert findings == [{
+        "document": "Bill of lading.pdf",
+        "findings": {"bill_of_lading": {"extracted_details": {"bl_number": "BL-42"}, "stamp_present": True}},
+    }]
+
+
+def test_analyze_documents_waits_for_cancelled_groups(make_pages):
+    documents = [("Bill of lading.pdf", make_pages(4, prefix="bill"))]
+    finished = []
+
+    async def analyze(pages, context=None):
+        try:
+            if pages == documents[0][1][:2]:
+                raise json.JSONDecodeError("Expecting value", "", 0)
+            await asyncio.sleep(5)
+        finally:
+            finished.append(pages)
+
+    async def main():
+        with pytest.raises(json.JSONDecodeError):
+            await analyze_documents(documents, analyze, 2, 10 ** 9)
+        # Every group call has stopped by the time the error reaches the caller
+        assert len(finished) == 2
+
+    asyncio.run(main())
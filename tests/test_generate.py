@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from src import generate
+from src.prompt import static_prompt
+from src.prompt_cache import LocalCacheBackend, PromptCache
+
+
+class FakeResponse:
+    text = "{}"
+
+
+class FakeModel:
+    def __init__(self):
+        self.contents = []
+
+    def generate_content(self, contents, **kwargs):
+        self.contents.append(contents)
+        return FakeResponse()
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.contents.append(contents)
+        return FakeResponse()
+
+
+@pytest.fixture
+def models(monkeypatch):
+    inline_model = FakeModel()
+    cached_model = FakeModel()
+    monkeypatch.setattr(generate, "model", inline_model)
+    monkeypatch.setattr(generate, "load_images", lambda image_paths: [f"image:{path}" for path in image_paths])
+    return inline_model, cached_model
+
+
+def use_cache(monkeypatch, cached_model, supported=True):
+    backend = LocalCacheBackend(model_factory=lambda handle: cached_model, supported=supported)
+    monkeypatch.setattr(generate, "prompt_cache", PromptCache(backend, "system"))
+    return backend
+
+
+def test_cached_model_receives_only_context_and_images(monkeypatch, models):
+    inline_model, cached_model = models
+    backend = use_cache(monkeypatch, cached_model)
+
+    generate.generate_multimodal_content("analyze", ["p1.png", "p2.png"], "note")
+
+    assert cached_model.contents == [["note", "image:p1.png", "image:p2.png"]]
+    assert inline_model.contents == []
+    assert backend.created[0]["contents"] == [f"{static_prompt} : analyze"]
+
+
+def test_cached_model_used_by_async_variant(monkeypatch, models):
+    inline_model, cached_model = models
+    use_cache(monkeypatch, cached_model)
+
+    asyncio.run(generate.generate_multimodal_content_async("analyze", ["p1.png"]))
+
+    assert cached_model.contents == [["image:p1.png"]]
+    assert inline_model.contents == []
+
+
+def test_unsupported_cache_sends_prefix_inline(monkeypatch, models):
+    inline_model, cached_model = models
+    use_cache(monkeypatch, cached_model, supported=False)
+
+    generate.generate_multimodal_content("analyze", ["p1.png"], "note")
+
+    assert inline_model.contents == [[f"{static_prompt} : analyze", "note", "image:p1.png"]]
+    assert cached_model.contents == []
@@ -0,0 +1,147 @@
+import threading
+from src.prompt_cache import LocalCacheBackend, PromptCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FailingBackend(LocalCacheBackend):
+    def __init__(self):
+        super().__init__()
+        self.attempts = 0
+
+    def create(self, system_instruction, contents, ttl, display_name):
+        self.attempts += 1
+        raise RuntimeError("cached content is below the minimum token count")
+
+
+def make_cache(backend, clock):
+    return PromptCache(backend, "system", ttl=100, refresh_margin=10, retry_backoff=2, clock=clock)
+
+
+def test_creates_handle_with_system_instruction_and_prefix():
+    backend = LocalCacheBackend()
+    cache = make_cache(backend, FakeClock())
+
+    handle = cache.get_model("prefix")
+
+    assert backend.created == [handle]
+    assert handle["system_instruction"] == "system"
+    assert handle["contents"] == ["prefix"]
+    assert handle["ttl"] == 100
+
+
+def test_reuses_handle_until_refresh_window():
+    backend = LocalCacheBackend()
+    clock = FakeClock()
+    cache = make_cache(backend, clock)
+
+    first = cache.get_model("prefix")
+    clock.now = 89
+    assert cache.get_model("prefix") is first
+    assert len(backend.created) == 1
+
+
+def test_refreshes_handle_before_expiry():
+    backend = LocalCacheBackend()
+    clock = FakeClock()
+    cache = make_cache(backend, clock)
+
+    first = cache.get_model("prefix")
+    clock.now = 91
+    second = cache.get_model("prefix")
+
+    assert second is not first
+    assert len(backend.created) == 2
+
+
+def test_new_handle_when_prompt_hash_changes():
+    backend = LocalCacheBackend()
+    cache = make_cache(backend, FakeClock())
+
+    first = cache.get_model("prefix")
+    second = cache.get_model("changed prefix")
+
+    assert first["display_name"] != second["display_name"]
+    assert cache.get_model("prefix") is first
+    assert len(backend.created) == 2
+
+
+def test_unsupported_backend_falls_back_to_inline():
+    backend = LocalCacheBackend(supported=False)
+    cache = make_cache(backend, FakeClock())
+
+    assert cache.get_model("prefix") is None
+    assert backend.created == []
+
+
+def test_failed_create_falls_back_and_retries_after_backoff():
+    backend = FailingBackend()
+    clock = FakeClock()
+    cache = make_cache(backend, clock)
+
+    assert cache.get_model("prefix") is None
+    clock.now = 1
+    assert cache.get_model("prefix") is None
+    assert backend.attempts == 1
+
+    clock.now = 2
+    assert cache.get_model("prefix") is None
+    assert backend.attempts == 2
+
+
+def test_failed_refresh_keeps_serving_unexpired_handle_and_retries_before_expiry():
+    backend = LocalCacheBackend()
+    clock = FakeClock()
+    cache = make_cache(backend, clock)
+    first = cache.get_model("prefix")
+    create = backend.create
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("backend unavailable")
+
+    backend.create = fail
+    clock.now = 91
+    assert cache.get_model("prefix") is first
+
+    backend.create = create
+    clock.now = 92
+    assert cache.get_model("prefix") is first
+    clock.now = 93
+    second = cache.get_model("prefix")
+    assert second is not first
+    assert len(backend.created) == 2
+
+
+def test_callers_use_current_handle_while_another_refreshes():
+    backend = LocalCacheBackend()
+    clock = FakeClock()
+    cache = make_cache(backend, clock)
+    first = cache.get_model("prefix")
+
+    started = threading.Event()
+    release = threading.Event()
+    create = backend.create
+
+    def slow_create(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return create(*args, **kwargs)
+
+    backend.create = slow_create
+    clock.now = 95
+    refresher = threading.Thread(target=cache.get_model, args=("prefix",))
+    refresher.start()
+    assert started.wait(5)
+
+    assert cache.get_model("prefix") is first
+
+    release.set()
+    refresher.join(5)
+    assert cache.get_model("prefix") is not first
+    assert len(backend.created) == 2
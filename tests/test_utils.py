@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import tempfile
+import threading
+import pytest
+from src import utils
+from src.utils import ClientDisconnected, LocalFile, process_pdf, run_with_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+        self.started = None
+
+    async def is_disconnected(self):
+        loop = asyncio.get_running_loop()
+        if self.started is None:
+            self.started = loop.time()
+        return self.disconnect_after is not None and loop.time() - self.started >= self.disconnect_after
+
+
+async def work(duration, events):
+    try:
+        await asyncio.sleep(duration)
+        return "report"
+    finally:
+        events.append("cleanup")
+
+
+def test_run_with_deadline_returns_result():
+    events = []
+    result = asyncio.run(run_with_deadline(FakeRequest(), work(0.01, events), 5, logger, poll_interval=0.01))
+    assert result == "report"
+    assert events == ["cleanup"]
+
+
+def test_run_with_deadline_cleans_up_before_timeout():
+    events = []
+
+    async def main():
+        try:
+            await run_with_deadline(FakeRequest(), work(5, events), 0.05, logger, poll_interval=0.01)
+        except asyncio.TimeoutError:
+            events.append("timeout")
+
+    asyncio.run(main())
+    assert events == ["cleanup", "timeout"]
+
+
+def test_run_with_deadline_cleans_up_before_disconnect():
+    events = []
+
+    async def main():
+        try:
+            await run_with_deadline(FakeRequest(disconnect_after=0.05), work(5, events), 5, logger, poll_interval=0.01)
+        except ClientDisconnected:
+            events.append("disconnected")
+
+    asyncio.run(main())
+    assert events == ["cleanup", "disconnected"]
+
+
+def test_cancelled_process_pdf_removes_rendered_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+    (tmp_path / "tmp").mkdir()
+    pdf = tmp_path / "Bill of lading.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+
+    second_batch_started = threading.Event()
+    release = threading.Event()
+    rendered = []
+
+    def render_pdf_pages(pdf_path, first_page, image_paths):
+        if first_page > 1:
+            second_batch_started.set()
+            release.wait(5)
+        for image_path in image_paths:
+            with open(image_path, "wb") as f:
+                f.write(b"png")
+            rendered.append(image_path)
+        return image_paths
+
+    monkeypatch.setattr(utils, "PDF_PAGE_BATCH_SIZE", 2)
+    monkeypatch.setattr(utils, "pdfinfo_from_path", lambda pdf_path, **kwargs: {"Pages": 5})
+    monkeypatch.setattr(utils, "render_pdf_pages", render_pdf_pages)
+
+    async def main():
+        task = asyncio.ensure_future(process_pdf(LocalFile(str(pdf)), logger))
+        await asyncio.to_thread(second_batch_started.wait, 5)
+        task.cancel()
+        # The running batch finishes after the cancellation and must still be cleaned up
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert len(rendered) == 4
+    assert list((tmp_path / "tmp").iterdir()) == []